@@ -28,9 +28,16 @@
 #   Pour Dev S3 (avec les identifiants de développement) :
 #       -> servicename-backup-primary-dev
 
-from datetime import datetime
-from pathlib import Path
-import os, subprocess, argparse, configparser, sys, time
+from datetime import datetime, timedelta
+import os, subprocess, argparse, configparser, sys, time, shutil, re, threading, shlex, mmap, fcntl, errno, json
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
 
 ## Argument parser
 parser = argparse.ArgumentParser(description='This program is intended to backup and restore all wordpress content and data to/from S3')
@@ -40,32 +47,47 @@ parser.add_argument('--show', action='store_true', help='Show available restore
 parser.add_argument('--env', help='The name of the env to backup/restore on S3 (dev or prod)', required=True)
 parser.add_argument('--date', help='The date to restore based on folder name on S3 (default to latest)', default="latest")
 parser.add_argument('--extra', help='Path to extra script to start after restore')
+parser.add_argument('--train-dict', action='store_true', help='Train a zstd dictionary from the paths to backup and upload it on S3')
 parser.add_argument('--debug', action='store_true', help='Print all commands before execution and skip cleanup')
 args = parser.parse_args()
 
-# Load configuration file
+scriptsDir = os.path.dirname(os.path.realpath(__file__)) + "/"
+
+# Load configuration file, flattened once as {(section, key): value}
 config = configparser.ConfigParser()
-config.read(os.path.dirname(os.path.realpath(__file__)) + '/syncManager.ini')
+config.read(scriptsDir + 'syncManager.ini')
+configValues = {(section, key): value for section in config.sections() for key, value in config.items(section)}
+
+# Value from the configuration file, missing sections or keys return the fallback
+def config_value(config_section, config_key, fallback=None):
+    return configValues.get((config_section, config.optionxform(config_key)), fallback)
 
 # Function to load env var or failover on the configuration file
-def get_value(env_var, config_section, config_key, as_list=False):
-    value = os.getenv(env_var) or config.get(config_section, config_key)
-    return value.split(',') if as_list else value
+def get_value(env_var, config_section, config_key, as_list=False, fallback=None):
+    value = os.getenv(env_var) or config_value(config_section, config_key, fallback)
+    return (value or "").split(',') if as_list else value
 
 ## Script env configuration
-scriptsDir = os.path.dirname(os.path.realpath(__file__)) + "/"
-servicename = config.get("info", "servicename")
+servicename = config_value("info", "servicename")
 pathsList = get_value('PATH_LIST', 'pathListTobackup', 'path', as_list=True)
 dbList = get_value('DATABASE_NAME', 'dbListTobackup', 'db', as_list=True)
 # Récupérer les données
 dbadmin = get_value('DATABASE_USERNAME', 'databaseCredentials', 'dbadmin')
 dbpassword = get_value('DATABASE_PASSWORD', 'databaseCredentials', 'dbpassword')
 dbhost = get_value('DATABASE_HOST', 'databaseCredentials', 'dbhost')
+# Mot de passe transmis aux clients mariadb par l'environnement plutôt qu'en ligne de commande (visible dans ps)
+mysqlEnv = dict(os.environ, MYSQL_PWD=dbpassword or "")
 s3AccessKey = get_value('S3_BACKUP_ACCESS_KEY', 's3Credentials', 's3AccessKey')
 s3SecretKey = get_value('S3_BACKUP_SECRET_KEY', 's3Credentials', 's3SecretKey')
 s3AccessKeyDev = get_value('S3_BACKUP_ACCESS_KEY_DEV', 's3Credentials', 's3AccessKeyDev')
 s3SecretKeyDev = get_value('S3_BACKUP_SECRET_KEY_DEV', 's3Credentials', 's3SecretKeyDev')
-retentionDays = config.getint("backupSettings", "retentionDays", fallback=30)
+retentionDays = int(config_value("backupSettings", "retentionDays", 30))
+# mydumper/myloader (dump parallèle) si présent, sinon mariadb-dump
+useMydumper = get_value('USE_MYDUMPER', 'backupSettings', 'useMydumper', fallback='true').lower() in ('1', 'true', 'yes', 'on') and shutil.which("mydumper") is not None
+# Archive écrite en O_DIRECT quand elle passe par le dossier temporaire (ne pollue pas le cache disque)
+directIO = get_value('ARCHIVE_DIRECT_IO', 'backupSettings', 'directIO', fallback='false').lower() in ('1', 'true', 'yes', 'on')
+# Restauration en flux : l'archive est extraite directement depuis S3 vers les dossiers cibles
+streamMode = get_value('STREAM', 'backupSettings', 'stream', fallback='false').lower() in ('1', 'true', 'yes', 'on')
 
 # Internal var generation :
 # Si l'environnement est dev, on utilise uniquement "primary-dev" sinon (prod) on utilise primary et secondary.
@@ -73,16 +95,18 @@ if args.env == "dev":
     s3AccessKey = s3AccessKeyDev
     s3SecretKey = s3SecretKeyDev
     regionS3 = {
-        "primary-dev": config.get("regionS3", "primary"),
+        "primary-dev": config_value("regionS3", "primary"),
     }
 else:
     regionS3 = {
-        "primary": config.get("regionS3", "primary"),
-        "secondary": config.get("regionS3", "secondary")
+        "primary": config_value("regionS3", "primary"),
+        "secondary": config_value("regionS3", "secondary")
     }
     
 workingDir = os.path.join(scriptsDir, 'temp')  # Use os.path.join to avoid extra slashes
 currentDate = datetime.now()
+# Restore points named before this one are purged from S3 (the YYYYmmdd-HHMMSS names sort chronologically)
+retentionCutoff = (currentDate - timedelta(days=retentionDays)).strftime('%Y%m%d-%H%M%S')
 
 # Use the restore point date for temp folder during restore, otherwise use current date
 if args.restore and args.date != "latest":
@@ -91,6 +115,37 @@ else:
     pathDate = currentDate.strftime('%Y%m%d-%H%M%S')
 
 dumpDirPath = os.path.join(workingDir, pathDate)  # Use os.path.join for clean path construction
+
+# Compression : zstd multi-thread si disponible, sinon pigz (gzip parallèle), sinon gzip
+zstdLevel = os.getenv('ZSTD_LEVEL', '3')
+zstdThreads = os.getenv('ZSTD_NBTHREADS', '0')
+useZstd = shutil.which("zstd") is not None
+# Same .tar.gz format as gzip, compressed on every core
+gzipProgram = f"pigz -p {os.cpu_count()}" if shutil.which("pigz") else "gzip"
+# 128 MiB window (--long=27) to catch redundancy across files of the tarball, the
+# decompressor must be given the same --long. --adapt lowers the level while the
+# upload is the bottleneck instead of stalling the pipeline on compression.
+zstdCommand = ["zstd", f"-T{zstdThreads}", f"-{zstdLevel}", "--long=27", "--adapt"]
+unzstdCommand = ["zstd", "-d", "--long=27"]
+# Database dumps use a fixed level (no --adapt) and no name/timestamp in gzip headers :
+# an unchanged database gives a byte-identical object, hence the same ETag
+dumpZstdCommand = ["zstd", f"-T{zstdThreads}", f"-{zstdLevel}", "--long=27"]
+# Dictionnaire zstd créé par --train-dict : utilisé pour l'archive s'il est présent,
+# et envoyé avec chaque sauvegarde pour que la restauration n'en dépende pas localement
+zstdDictName = "syncmanager.zdict"
+zstdDictFolder = "dict"
+zstdDictPath = scriptsDir + zstdDictName
+useZstdDict = useZstd and os.path.exists(zstdDictPath)
+if useZstd:
+    archiveName = "backup.tar.zst"
+    compressProgram = " ".join(zstdCommand + (["-D", zstdDictPath] if useZstdDict else []))
+else:
+    archiveName = "backup.tar.gz"
+    compressProgram = gzipProgram
+archivePath = os.path.join(workingDir, archiveName)
+# Dumps envoyés directement sur S3 quand l'archive est en flux : même niveau que l'archive, sans --adapt ni dictionnaire
+dumpExt = ".sql.zst" if useZstd else ".sql.gz"
+dumpCompressCommand = dumpZstdCommand if useZstd else gzipProgram.split() + ["-n"]
 excludedDbs = ['mysql', 'information_schema', 'performance_schema', 'sys']    
 start_time = time.time()
 
@@ -101,25 +156,394 @@ class bcolors:
     WARNING = "\033[93m"
     FAIL    = "\033[91m"
 
+# No ANSI escapes when the output is not a terminal (cron logs)
+if not sys.stdout.isatty():
+    bcolors.DEFAULT = bcolors.OKGREEN = bcolors.HEADER = bcolors.WARNING = bcolors.FAIL = ""
+
+# First character of a message -> (prefix, suffix, flush), built once. "-" lines stay
+# open for the following "done" and are flushed so the running step is visible,
+# anything else is a complete header line.
+progressFormats = {
+    "!": (bcolors.WARNING, bcolors.DEFAULT + "\n", False),
+    "+": (bcolors.FAIL, bcolors.DEFAULT + "\n", False),
+    "-": ("", "", True),
+}
+progressHeader = (bcolors.HEADER, bcolors.DEFAULT + "\n", False)
+progressDone = f"{bcolors.OKGREEN} ✔{bcolors.DEFAULT}\n"
+
+# Re-entrant so that a worker thread can hold it across a "-- step" / "done" pair
+progressLock = threading.RLock()
+
 def progress(text):
-    if text == "done":
-        return print(f"{bcolors.OKGREEN} ✔{bcolors.DEFAULT}")
-    elif text[0] == "!":
-        return print(f"{bcolors.WARNING}{text}{bcolors.DEFAULT}")
-    elif text[0] == "+":
-        return print(f"{bcolors.FAIL}{text}{bcolors.DEFAULT}")
-    elif text[0] == "-":
-        return print(f"{text}", end="", flush=True)
-    else:
-        return print(f"{bcolors.HEADER}{text}{bcolors.DEFAULT}")
+    with progressLock:
+        if text == "done":
+            sys.stdout.write(progressDone)
+            return
+        prefix, suffix, flush = progressFormats.get(text[:1], progressHeader)
+        sys.stdout.write(prefix + text + suffix)
+        if flush:
+            sys.stdout.flush()
+
+# Stop the script when an external command fails (only the program name is
+# printed, arguments may contain credentials)
+def command_failed(cmd):
+    progress(f"+! Command failed: {cmd[0]}")
+    sys.exit(1)
+
+# Custom subprocess wrapper to support debug mode, commands are argv lists run without shell
+def run_command(cmd, check=True, okCodes=(0,), **kwargs):
+    if args.debug:
+        print(f"DEBUG: {shlex.join(cmd)}")
+    result = subprocess.run(cmd, **kwargs)
+    if check and result.returncode not in okCodes:
+        command_failed(cmd)
+    return result
 
-# Custom os.system wrapper to support debug mode
-def run_command(cmd):
+# Same as run_command but returns the running process, used to build pipelines
+def start_command(cmd, **kwargs):
     if args.debug:
-        print(f"DEBUG: {cmd}")
-        os.system(cmd)
+        print(f"DEBUG: {shlex.join(cmd)}")
+    return subprocess.Popen(cmd, **kwargs)
+
+# Wait for a process started with start_command and check its exit code
+def wait_command(process, okCodes=(0,)):
+    if process.wait() not in okCodes:
+        command_failed(process.args)
+
+# tar argv for the backup archive written to output ("-" for stdout) : database
+# dumps from the temp folder, then the backed up paths read in place from /
+# (stored relative to /, i.e. under the same tree layout as the temp folder)
+# Sources are live (cache, uploads) : tar exits with 1 when a file changes while
+# it is read, the archive is still complete and usable, only 2 is a real failure
+archiveExitCodes = (0, 1)
+
+def archive_command(output):
+    cmd = ["tar", f"--use-compress-program={compressProgram}", "--warning=no-file-changed", "-cf", output, "-C", dumpDirPath, "."]
+    paths = [path.lstrip("/") for path in pathsList if path]
+    if paths:
+        cmd += ["-C", "/"] + paths
+    return cmd
+
+# tar argv extracting an archive read from stdin in place : members under the
+# backed up paths go straight to their location under /, everything else (dumps,
+# mydumper folder) to the temp folder. Expressions are applied in order, "S"
+# keeps symlink targets untouched. Handles both "./var/www" and "var/www" members.
+def extract_in_place_command(decompressProgram):
+    # Escape a literal for the regex / replacement part of a sed expression
+    regex = lambda text: re.sub(r"([\\.\[\]*^$,])", r"\\\1", text)
+    literal = lambda text: re.sub(r"([\\&,])", r"\\\1", text)
+    dumpDir = dumpDirPath.strip("/")
+    cmd = ["tar", f"--use-compress-program={decompressProgram}", "-xf", "-", "-C", "/",
+           r"--transform=s,^\./,,S", f"--transform=s,^,{literal(dumpDir)}/,S"]
+    for path in pathsList:
+        if path:
+            path = path.strip("/")
+            cmd.append(f"--transform=s,^{regex(dumpDir + '/' + path)}\\(/\\|$\\),{literal(path)}\\1,S")
+    return cmd
+
+# Buffered writes from now on, for data that no longer fits O_DIRECT's alignment
+def clear_direct_io(fd):
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_DIRECT)
+
+# os.write may write less than asked (signal, full device), loop until everything is written.
+# After a short write the file offset is no longer aligned, O_DIRECT would fail with EINVAL.
+def write_fully(fd, data):
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+        if data:
+            clear_direct_io(fd)
+
+# Write tar's output to path with O_DIRECT, bypassing the page cache. Data is
+# staged in a page aligned mmap buffer as O_DIRECT requires aligned writes, the
+# last partial block is written after clearing O_DIRECT on the descriptor.
+def write_archive_direct(path):
+    blockSize = 8 * 1024 * 1024
+    buffer = mmap.mmap(-1, blockSize)
+    view = memoryview(buffer)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o600)
+    except OSError:
+        # O_DIRECT is not supported by every filesystem (tmpfs, some overlayfs)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    archive = start_command(archive_command("-"), stdout=subprocess.PIPE, bufsize=0)
+    try:
+        while True:
+            filled = 0
+            while filled < blockSize and (count := archive.stdout.readinto(view[filled:])):
+                filled += count
+            if filled < blockSize:
+                clear_direct_io(fd)
+                write_fully(fd, view[:filled])
+                break
+            write_fully(fd, view)
+    finally:
+        os.close(fd)
+        view.release()
+        buffer.close()
+    wait_command(archive, archiveExitCodes)
+
+#####################
+#    S3 helpers     #
+#####################
+# boto3 (connexion persistante, multipart) si disponible, sinon s5cmd (requêtes
+# S3 parallèles), sinon s3cmd
+useBoto3 = boto3 is not None
+useS5cmd = shutil.which("s5cmd") is not None
+# boto3 and s5cmd can both upload a stream, the archive is then never written locally
+streamArchive = useBoto3 or useS5cmd
+# Identifiants transmis à s5cmd par l'environnement plutôt qu'en ligne de commande
+s5cmdEnv = dict(os.environ, AWS_ACCESS_KEY_ID=s3AccessKey, AWS_SECRET_ACCESS_KEY=s3SecretKey)
+# Multipart : parts de 64 MiB (S3_PART_MB), 32 envoyées en parallèle par transfert
+partSizeMb = int(os.getenv('S3_PART_MB', '64'))
+transferConcurrency = 32
+s5cmdTransferOptions = ["--concurrency", str(transferConcurrency), "--part-size", str(partSizeMb)]
+# Un flux (pipe) ne peut pas être relu ni écrit dans le désordre : chaque part est gardée
+# en mémoire jusqu'à son envoi (ou son écriture dans le pipe pour s3_cat).
+# Au plus 4 parts par flux pour l'archive (256 MiB par défaut).
+streamConcurrency = 4
+s5cmdStreamOptions = ["--concurrency", str(streamConcurrency), "--part-size", str(partSizeMb)]
+# Dumps : petites parts (16 MiB, 2 en vol, 32 MiB par flux et par région) car ils sont
+# nombreux en même temps : DUMP_WORKERS mariadb-dump (un par coeur par défaut) à
+# l'envoi, au plus 4 bases restaurées depuis S3, chacune avec son propre téléchargement
+dumpPartSizeMb = 16
+dumpStreamConcurrency = 2
+dumpWorkers = int(os.getenv('DUMP_WORKERS', str(os.cpu_count())))
+remoteRestoreWorkers = 4
+s5cmdDumpOptions = ["--concurrency", str(dumpStreamConcurrency), "--part-size", str(dumpPartSizeMb)]
+if useBoto3:
+    # One client per region, created upfront (client creation is not thread safe) and kept alive for the whole run.
+    # The connection pool covers a multipart transfer plus the concurrent dumps/copies, adaptive retries absorb throttling.
+    botoConfig = BotoConfig(max_pool_connections=64, retries={"max_attempts": 10, "mode": "adaptive"})
+    s3Clients = {region: boto3.client("s3", endpoint_url=f"https://{region}", aws_access_key_id=s3AccessKey, aws_secret_access_key=s3SecretKey, config=botoConfig) for region in regionS3.values()}
+    transferConfig = TransferConfig(multipart_threshold=partSizeMb * 1024 * 1024, multipart_chunksize=partSizeMb * 1024 * 1024, max_concurrency=transferConcurrency, use_threads=True)
+    streamTransferConfig = TransferConfig(multipart_threshold=partSizeMb * 1024 * 1024, multipart_chunksize=partSizeMb * 1024 * 1024, max_concurrency=streamConcurrency, use_threads=True)
+    # Not exposed by the boto3 constructor, read by s3transfer for non seekable uploads
+    streamTransferConfig.max_in_memory_upload_chunks = streamConcurrency
+    dumpTransferConfig = TransferConfig(multipart_threshold=dumpPartSizeMb * 1024 * 1024, multipart_chunksize=dumpPartSizeMb * 1024 * 1024, max_concurrency=dumpStreamConcurrency, use_threads=True)
+    dumpTransferConfig.max_in_memory_upload_chunks = dumpStreamConcurrency
+
+# Base argv of the CLI clients, built once per region
+s3cmdArgs = {region: ["s3cmd", "-q", "-c", f"{scriptsDir}s3.cfg", f"--host={region}", f"--access_key={s3AccessKey}", f"--secret_key={s3SecretKey}", f"--multipart-chunk-size-mb={partSizeMb}"] for region in regionS3.values()}
+s5cmdArgs = {region: ["s5cmd", "--numworkers", "256", f"--endpoint-url=https://{region}"] for region in regionS3.values()}
+
+# "s3://bucket/some/key" -> ("bucket", "some/key")
+def split_uri(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+# ETag of every object under a prefix, keyed by the name relative to the prefix, for boto3
+def s3_etags(region, bucket, prefix):
+    pages = s3Clients[region].get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix)
+    return {obj["Key"][len(prefix):]: obj["ETag"] for page in pages for obj in page.get("Contents", [])}
+
+# All object keys under a prefix, for boto3
+def s3_keys(region, bucket, prefix):
+    return [prefix + name for name in s3_etags(region, bucket, prefix)]
+
+# Delete keys with DeleteObjects (1000 keys max per request), for boto3
+def s3_delete_keys(region, bucket, keys):
+    for start in range(0, len(keys), 1000):
+        s3Clients[region].delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True})
+
+# List a bucket or a folder, yields full s3:// paths as the listing comes in (page by page
+# with boto3, line by line from the CLI output otherwise).
+# The last column of each line is the path (relative to uri for s5cmd).
+def s3_ls(region, uri):
+    if useBoto3:
+        bucket, prefix = split_uri(uri)
+        for page in s3Clients[region].get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+            yield from (f"s3://{bucket}/{folder['Prefix']}" for folder in page.get("CommonPrefixes", []))
+            yield from (f"s3://{bucket}/{obj['Key']}" for obj in page.get("Contents", []))
+        return
+    if useS5cmd:
+        cmd, env, base = s5cmdArgs[region] + ["ls", uri], s5cmdEnv, uri
+    else:
+        cmd, env, base = s3cmdArgs[region] + ["ls", uri], None, ""
+    # A missing folder is an empty listing, errors are not checked
+    with start_command(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as listing:
+        for line in listing.stdout:
+            if line.strip():
+                yield base + line.rsplit(None, 1)[-1]
+
+# Existence of a single object (HEAD request), without listing its folder
+def s3_exists(region, remotePath):
+    if useBoto3:
+        bucket, key = split_uri(remotePath)
+        try:
+            s3Clients[region].head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+    if useS5cmd:
+        return run_command(s5cmdArgs[region] + ["ls", remotePath], check=False, env=s5cmdEnv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    return run_command(s3cmdArgs[region] + ["info", remotePath], check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+
+# Top level folder names of a bucket ("20241122-093000", "latest", ...), from the
+# CommonPrefixes of a delimited listing with boto3
+def s3_list_folders(region, bucket):
+    if useBoto3:
+        pages = s3Clients[region].get_paginator("list_objects_v2").paginate(Bucket=bucket, Delimiter="/")
+        return [folder["Prefix"].rstrip("/") for page in pages for folder in page.get("CommonPrefixes", [])]
+    return [uri.split('/')[3] for uri in s3_ls(region, f"s3://{bucket}/") if uri.endswith("/")]
+
+# Restore points listed by --show are kept for 60 s next to the script (JSON, never executed),
+# repeated calls from an operator shell then skip the S3 listing
+showCacheTtl = 60
+def show_cache_path(region, bucket):
+    return f"{scriptsDir}.syncmanager_show_{region}_{bucket}.json"
+
+# Cached restore points, None when the cache is missing, expired or unreadable (symlinks are refused)
+def read_show_cache(cachePath):
+    try:
+        fd = os.open(cachePath, os.O_RDONLY | os.O_NOFOLLOW)
+        with os.fdopen(fd) as cacheFile:
+            if time.time() - os.fstat(cacheFile.fileno()).st_mtime > showCacheTtl:
+                return None
+            return json.load(cacheFile)
+    except (OSError, ValueError):
+        return None
+
+# Written to a new private file then renamed over the cache, a failure only disables the cache
+def write_show_cache(cachePath, restorePoints):
+    tmpPath = f"{cachePath}.{os.getpid()}"
+    try:
+        fd = os.open(tmpPath, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+        with os.fdopen(fd, "w") as cacheFile:
+            json.dump(restorePoints, cacheFile)
+        os.replace(tmpPath, cachePath)
+    except OSError:
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+
+def s3_put(region, localPath, remoteFolder):
+    if useBoto3:
+        bucket, prefix = split_uri(remoteFolder)
+        s3Clients[region].upload_file(localPath, bucket, prefix + os.path.basename(localPath), Config=transferConfig)
+    elif useS5cmd:
+        run_command(s5cmdArgs[region] + ["cp"] + s5cmdTransferOptions + [localPath, remoteFolder], env=s5cmdEnv)
     else:
-        os.system(cmd)
+        run_command(s3cmdArgs[region] + ["put", localPath, remoteFolder])
+
+def s3_get(region, remotePath, localPath):
+    if useBoto3:
+        s3Clients[region].download_file(*split_uri(remotePath), localPath, Config=transferConfig)
+    elif useS5cmd:
+        run_command(s5cmdArgs[region] + ["cp"] + s5cmdTransferOptions + [remotePath, localPath], env=s5cmdEnv)
+    else:
+        run_command(s3cmdArgs[region] + ["get", remotePath, localPath])
+
+# Download an object into an open binary file, e.g. the stdin of another process.
+# boto3 and s5cmd fetch byte ranges in parallel and write them back in order : ranges
+# received ahead of the one being written wait in memory, the stream settings bound them
+# (the smaller dump settings when dump is set, several dumps are downloaded at once).
+def s3_cat(region, remotePath, output, dump=False):
+    if useBoto3:
+        s3Clients[region].download_fileobj(*split_uri(remotePath), output, Config=dumpTransferConfig if dump else streamTransferConfig)
+    elif useS5cmd:
+        run_command(s5cmdArgs[region] + ["cat"] + (s5cmdDumpOptions if dump else s5cmdStreamOptions) + [remotePath], env=s5cmdEnv, stdout=output)
+    else:
+        run_command(s3cmdArgs[region] + ["get", remotePath, "-"], stdout=output)
+
+# Make latest/ a server side copy of the given folder. Keys are overwritten in place,
+# only those missing from the new restore point (e.g. a removed database) are deleted,
+# so latest/ is never empty while it is being replaced.
+def s3_promote_latest(region, bucket, folder):
+    if useBoto3:
+        # Objects whose ETag matches the one already in latest/ (same content and part size) are not copied again
+        published = s3_etags(region, bucket, "latest/")
+        names = s3_etags(region, bucket, f"{folder}/")
+        for name, etag in names.items():
+            if published.get(name) != etag:
+                s3Clients[region].copy({"Bucket": bucket, "Key": f"{folder}/{name}"}, bucket, "latest/" + name, Config=transferConfig)
+        s3_delete_keys(region, bucket, ["latest/" + name for name in published if name not in names])
+    elif useS5cmd:
+        run_command(s5cmdArgs[region] + ["sync", "--delete", f"s3://{bucket}/{folder}/*", f"s3://{bucket}/latest/"], env=s5cmdEnv)
+    else:
+        run_command(s3cmdArgs[region] + ["sync", "--delete-removed", f"s3://{bucket}/{folder}/", f"s3://{bucket}/latest/"])
+
+# Upload a readable stream to S3 with boto3 (multipart), closes the stream when done
+def s3_upload_stream(region, stream, remotePath, dump=False):
+    with stream:
+        s3Clients[region].upload_fileobj(stream, *split_uri(remotePath), Config=dumpTransferConfig if dump else streamTransferConfig)
+
+# Upload the output of a running process (started with stdout=PIPE) to every remote path
+# at once, nothing is written to the temp folder. Requires boto3 or s5cmd (pipe command).
+# dump selects the smaller per stream settings used for database dumps, upstream lists the
+# processes feeding source (e.g. mariadb-dump before its compressor), checked as well.
+# When anything fails no object is left behind: a truncated stream is never published.
+def s3_stream(source, destinations, okCodes=(0,), dump=False, upstream=()):
+    sinks, uploads, failed = [], [], source
+    with ThreadPoolExecutor(max_workers=len(destinations)) as executor:
+        try:
+            for region, remotePath in destinations:
+                if useBoto3:
+                    readFd, writeFd = os.pipe()
+                    sinks.append(os.fdopen(writeFd, "wb"))
+                    uploads.append(executor.submit(s3_upload_stream, region, os.fdopen(readFd, "rb"), remotePath, dump))
+                else:
+                    uploads.append(start_command(s5cmdArgs[region] + ["pipe"] + (s5cmdDumpOptions if dump else s5cmdStreamOptions) + [remotePath], env=s5cmdEnv, stdin=subprocess.PIPE))
+                    sinks.append(uploads[-1].stdin)
+            while chunk := source.stdout.read(8 * 1024 * 1024):
+                for sink in sinks:
+                    sink.write(chunk)
+            # Exit codes are checked before closing the sinks, as EOF is what completes the uploads
+            checks = [(process, (0,)) for process in upstream] + [(source, okCodes)]
+            failed = next((process for process, codes in checks if process.wait() not in codes), None)
+        finally:
+            if failed:
+                # Envoi en échec, interruption ou source en erreur : la source est arrêtée et
+                # s5cmd, interrompu avant EOF, abandonne son envoi multipart
+                source.kill()
+                for upload in uploads:
+                    if not useBoto3:
+                        upload.terminate()
+            # Every sink is closed before waiting on any upload, otherwise an upload
+            # still reading an open pipe never returns and the executor waits forever
+            for sink in sinks:
+                try:
+                    sink.close()
+                except OSError:
+                    pass  # reader already gone, its upload reports the error
+            if not failed:
+                for upload in uploads:
+                    if useBoto3:
+                        upload.result()
+                    else:
+                        wait_command(upload)
+            elif useBoto3:
+                # boto3 completes an upload at EOF : what was uploaded is removed again
+                for (region, remotePath), upload in zip(destinations, uploads):
+                    if upload.exception() is None:
+                        bucket, key = split_uri(remotePath)
+                        s3Clients[region].delete_object(Bucket=bucket, Key=key)
+                # Raises the upload's own error rather than the BrokenPipe it caused
+                for upload in uploads:
+                    if upload.exception():
+                        raise upload.exception()
+            else:
+                for upload in uploads:
+                    upload.wait()
+    if failed:
+        command_failed(failed.args)
+
+# Remove whole folders, in a single "s5cmd run" batch when available
+def s3_rm_folders(region, folders):
+    if not folders:
+        return
+    if useBoto3:
+        # Keys of every folder gathered first, then deleted 1000 at a time
+        bucket = split_uri(folders[0])[0]
+        s3_delete_keys(region, bucket, [key for folder in folders for key in s3_keys(region, bucket, split_uri(folder)[1])])
+    elif useS5cmd:
+        run_command(s5cmdArgs[region] + ["run"], env=s5cmdEnv, input="".join(f"rm {folder}*\n" for folder in folders), text=True)
+    else:
+        for folder in folders:
+            run_command(s3cmdArgs[region] + ["--force", "del", "-r", folder])
 
 # Testing mandatory var presence
 def testVars():
@@ -127,7 +551,7 @@ def testVars():
         ("-- Service name", servicename),
         ("-- S3 Access key", s3AccessKey),
         ("-- S3 Secret key", s3SecretKey),
-    ]
+    ] + [(f"-- S3 {priority} region", region) for priority, region in regionS3.items()]
     errors = []
     # Check vars
     for var_name, var_value in mandatory_vars:
@@ -146,11 +570,123 @@ testVars()
 def checkBaseFolder():
     progress("-- Create temp folder for backup or restore...")
     if not os.path.exists(workingDir):
-        run_command(f"mkdir {workingDir}")
+        run_command(["mkdir", workingDir])
     if not os.path.exists(dumpDirPath):
-        run_command(f"mkdir {dumpDirPath}")
+        run_command(["mkdir", dumpDirPath])
     progress("done")
 
+# Delete everything inside a folder (dotfiles included) but keep the folder itself
+def clear_folder(path):
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
+
+# Move every entry of src into dst (dotfiles included); rename is metadata only,
+# shutil.move copies when the temp folder is on another filesystem
+def move_folder_content(src, dst):
+    for entry in os.scandir(src):
+        target = os.path.join(dst, entry.name)
+        try:
+            os.rename(entry.path, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.move(entry.path, target)
+
+# In-process equivalent of chown -R, symlinks are changed but never followed
+def chown_tree(path, uid, gid):
+    os.chown(path, uid, gid)
+    for root, dirs, files, rootfd in os.fwalk(path):
+        for name in dirs + files:
+            os.chown(name, uid, gid, dir_fd=rootfd, follow_symlinks=False)
+
+# Dump one database with mariadb-dump, called concurrently for every database.
+# When the archive is streamed the dump goes straight to S3 as {pathDate}/db/{db}.sql.zst (or .sql.gz),
+# otherwise it is written to the temp folder, compressed on the fly with zstd when available.
+def dump_db(db):
+    dumpCmd = ["mariadb-dump", "-u", dbadmin, "-h", dbhost, "--complete-insert", "--routines", "--triggers", "--single-transaction", "--quick", "--skip-dump-date", db]
+    if streamArchive:
+        dump = start_command(dumpCmd, env=mysqlEnv, stdout=subprocess.PIPE)
+        compress = start_command(dumpCompressCommand, stdin=dump.stdout, stdout=subprocess.PIPE)
+        dump.stdout.close()
+        s3_stream(compress, [(region, f"s3://{servicename}-backup-{priority}/{pathDate}/db/{db}{dumpExt}") for priority, region in regionS3.items()], dump=True, upstream=[dump])
+        with progressLock:
+            progress("-- Backup database " + db + " to S3...")
+            progress("done")
+        return
+    if useZstd:
+        with open(os.path.join(dumpDirPath, db + ".sql.zst"), "wb") as dumpFile:
+            dump = start_command(dumpCmd, env=mysqlEnv, stdout=subprocess.PIPE)
+            compress = start_command(dumpZstdCommand, stdin=dump.stdout, stdout=dumpFile)
+            dump.stdout.close()
+            wait_command(dump)
+            wait_command(compress)
+    else:
+        with open(os.path.join(dumpDirPath, db + ".sql"), "wb") as dumpFile:
+            run_command(dumpCmd, env=mysqlEnv, stdout=dumpFile)
+    with progressLock:
+        progress("-- Backup database " + db + " to the temp folder...")
+        progress("done")
+
+# Drop, create and reload one database from S3 or the temp folder, called concurrently for every database
+# (one at a time with myloader, which is already multi-threaded). Progress is reported by the caller.
+def restore_db(db):
+    run_command(["mariadb-admin", "-s", "-u" + dbadmin, "-h", dbhost, "-f", "drop", db], check=False, env=mysqlEnv, stdout=subprocess.DEVNULL)
+    run_command(["mariadb-admin", "-s", "-u" + dbadmin, "-h", dbhost, "-f", "create", db], env=mysqlEnv)
+    dumpPath = os.path.join(dumpDirPath, db + ".sql")
+    if db in remoteDumps:
+        # Dump stocké à part de l'archive : S3 -> décompression -> mariadb, sans passer par le disque
+        decompressCmd = unzstdCommand if remoteDumps[db].endswith(".zst") else gzipProgram.split() + ["-d"]
+        decompress = start_command(decompressCmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        load = start_command(["mariadb", "-u" + dbadmin, "-h", dbhost, "-D", db], env=mysqlEnv, stdin=decompress.stdout)
+        decompress.stdout.close()
+        s3_cat(default_region, remoteDumps[db], decompress.stdin, dump=True)
+        decompress.stdin.close()
+        wait_command(decompress)
+        wait_command(load)
+    elif os.path.isdir(mydumperDir):
+        run_command(["myloader", "-u", dbadmin, "-h", dbhost, f"--directory={mydumperDir}", f"--source-db={db}", f"--database={db}", f"--threads={os.cpu_count()}", "--queries-per-transaction=50000", "--overwrite-tables"], env=mysqlEnv)
+    elif os.path.exists(dumpPath + ".zst"):
+        decompress = start_command(unzstdCommand + ["-c", dumpPath + ".zst"], stdout=subprocess.PIPE)
+        load = start_command(["mariadb", "-u" + dbadmin, "-h", dbhost, "-D", db], env=mysqlEnv, stdin=decompress.stdout)
+        decompress.stdout.close()
+        wait_command(decompress)
+        wait_command(load)
+    else:
+        with open(dumpPath, "rb") as dumpFile:
+            run_command(["mariadb", "-u" + dbadmin, "-h", dbhost, "-D", db], env=mysqlEnv, stdin=dumpFile)
+    return db
+
+# Upload the archive to one region, promote it as latest and apply retention.
+# Called concurrently for every region, each step is reported once finished.
+def push_region(priority, region):
+    bucket = f"{servicename}-backup-{priority}"
+    # Already uploaded by s3_stream when the archive is streamed
+    if not streamArchive:
+        s3_put(region, archivePath, f"s3://{bucket}/{pathDate}/")
+    if useZstdDict:
+        s3_put(region, zstdDictPath, f"s3://{bucket}/{pathDate}/")
+    s3_promote_latest(region, bucket, pathDate)
+    with progressLock:
+        progress("-- Upload compressed archive to " + region + " on s3://" + bucket + "...")
+        progress("done")
+    # Only dated folders are subject to retention (not latest/ nor dict/)
+    expiredFolders = [f"s3://{bucket}/{folder}/" for folder in s3_list_folders(region, bucket) if re.fullmatch(r"\d{8}-\d{6}", folder) and folder < retentionCutoff]
+    s3_rm_folders(region, expiredFolders)
+    with progressLock:
+        for folder in expiredFolders:
+            progress('-- removing folder: ' + folder)
+            progress("done")
+        progress("-- S3 Cleanup on " + region + "...")
+        progress("done")
+    # New restore point and retention : the --show cache is outdated
+    try:
+        os.remove(show_cache_path(region, bucket))
+    except FileNotFoundError:
+        pass
+
 #####################
 #                   #
 #     Backup        #
@@ -166,7 +702,7 @@ if args.backup:
         else:
             progress("!- No database specified, trying to search with credentials")
             # Récupérer toutes les bases
-            databaseList = subprocess.check_output("mariadb -u " + dbadmin + " -p" + dbpassword + " -sN -e 'show databases'", shell=True).decode().split("\n")
+            databaseList = run_command(["mariadb", "-u", dbadmin, "-h", dbhost, "-sN", "-e", "show databases"], env=mysqlEnv, capture_output=True, text=True).stdout.split("\n")
             cleanDatabaseList = []
             for database in databaseList:
                 if database not in excludedDbs:
@@ -183,40 +719,44 @@ if args.backup:
     if args.env == "dev" or args.env == "prod":
         progress("Starting backup of " + servicename + " to S3 " + args.env)
         checkBaseFolder()
+        # Dictionnaire entraîné ailleurs (nouveau conteneur) : récupéré depuis dict/ s'il manque localement
+        dictPriority, dictRegion = next(iter(regionS3.items()))
+        remoteDict = f"s3://{servicename}-backup-{dictPriority}/{zstdDictFolder}/{zstdDictName}"
+        if useZstd and not useZstdDict and s3_exists(dictRegion, remoteDict):
+            progress("-- Download zstd dictionary from " + remoteDict + "...")
+            s3_get(dictRegion, remoteDict, zstdDictPath)
+            useZstdDict = True
+            compressProgram = " ".join(zstdCommand + ["-D", zstdDictPath])
+            progress("done")
         # Backup de toutes les bases
-        if dbpassword:
-            for db in dbList:
-                progress("-- Backup database " + db + " to the temp folder...")
-                run_command(f"mariadb-dump -u {dbadmin} -p{dbpassword} -h {dbhost} --complete-insert --routines --triggers --single-transaction \"{db}\" > {os.path.join(dumpDirPath, f'{db}.sql')}")
-                progress("done")
-        if any(pathsList):
-            for path in pathsList:
-                progress("-- Copy all content from " + path + " to the temp folder...")
-                # Création de l'arborescence source puis copie des fichiers
-                run_command(f"mkdir -p {os.path.join(dumpDirPath, path)} && cp -r {path}/* {os.path.join(dumpDirPath, path)}/")
-                progress("done")
-        else:
+        if dbpassword and any(dbList) and useMydumper:
+            progress("-- Backup databases " + ", ".join(dbList) + " with mydumper to the temp folder...")
+            # Un seul mydumper pour toutes les bases, filtrées par regex "db.table"
+            dbRegex = "^(" + "|".join(re.escape(db) for db in dbList) + ")\\."
+            run_command(["mydumper", "-u", dbadmin, "-h", dbhost, "--regex", dbRegex, f"--threads={os.cpu_count()}", "--rows=50000", "--compress", "--trx-consistency-only", "-G", "-E", "-R", "-o", os.path.join(dumpDirPath, 'mydumper')], env=mysqlEnv)
+            progress("done")
+        elif dbpassword and any(dbList):
+            # Un mariadb-dump par base, en parallèle
+            with ThreadPoolExecutor(max_workers=min(len(dbList), dumpWorkers)) as executor:
+                list(executor.map(dump_db, dbList))
+        # Les fichiers sont lus directement par tar, sans copie dans le dossier temporaire
+        if not any(pathsList):
             progress("!- No files specified, database backup only")
-        progress("-- Compress all files in the temp folder")
-        run_command(f"tar -C {dumpDirPath} -czf {os.path.join(workingDir, 'backup.tar.gz')} .")
+        if streamArchive:
+            progress("-- Compress the archive and stream it to S3")
+            s3_stream(start_command(archive_command("-"), stdout=subprocess.PIPE), [(region, f"s3://{servicename}-backup-{priority}/{pathDate}/{archiveName}") for priority, region in regionS3.items()], archiveExitCodes)
+        else:
+            progress("-- Compress databases and files in the temp folder")
+            if directIO:
+                write_archive_direct(archivePath)
+            else:
+                run_command(archive_command(archivePath), okCodes=archiveExitCodes)
         progress("done")
-        # Upload sur S3
-        for priority, region in regionS3.items():
-            progress("-- Upload compressed archive to " + region + " on s3://" + servicename + "-backup-" + priority + "...")
-            run_command(f"s3cmd -q -c {scriptsDir}s3.cfg --host={region} --access_key={s3AccessKey} --secret_key={s3SecretKey} put {os.path.join(workingDir, 'backup.tar.gz')} s3://{servicename}-backup-{priority}/{pathDate}/")
-            run_command(f"s3cmd -q -c {scriptsDir}s3.cfg --host={region} --access_key={s3AccessKey} --secret_key={s3SecretKey} del -r s3://{servicename}-backup-{priority}/latest/")
-            run_command(f"s3cmd -q -c {scriptsDir}s3.cfg --host={region} --access_key={s3AccessKey} --secret_key={s3SecretKey} cp -r s3://{servicename}-backup-{priority}/{pathDate}/ s3://{servicename}-backup-{priority}/latest/")
-            progress("done")
-            progress("-- S3 Cleanup on " + region + "...")
-            folderList = os.popen(f"s3cmd -q -c {scriptsDir}s3.cfg --host={region} --access_key={s3AccessKey} --secret_key={s3SecretKey} ls s3://{servicename}-backup-{priority}/ | awk '{{print $NF}}'").read().splitlines()
-            for folder in folderList:
-                if folder != f"s3://{servicename}-backup-{priority}/latest/":
-                    folderDate = (folder.split('/'))[3]
-                    folderDate = datetime.strptime(folderDate, '%Y%m%d-%H%M%S')
-                    if (datetime.timestamp(currentDate) - datetime.timestamp(folderDate)) > (retentionDays * 24 * 60 * 60):
-                        progress('-- removing folder: ' + folder)
-                        run_command(f"s3cmd -c --force {scriptsDir}s3.cfg --host={region} --access_key={s3AccessKey} --secret_key={s3SecretKey} del -r {folder}")
-            progress("done")
+        # Upload sur S3, toutes les régions en parallèle
+        progress("-- Upload to " + ", ".join(regionS3.values()) + " in parallel")
+        print()
+        with ThreadPoolExecutor(max_workers=len(regionS3)) as executor:
+            list(executor.map(lambda item: push_region(*item), regionS3.items()))
     else:
         progress("-- Please specify destination prod or dev")
 
@@ -236,62 +776,133 @@ elif args.restore:
     default_region = regionS3.get(bucket_key)
     bucket_name = f"{servicename}-backup-{bucket_key}"
     
-    # Vérifier si la date spécifiée existe sur S3
-    if not (os.popen(f"s3cmd -c {scriptsDir}s3.cfg --host={default_region} --access_key={s3AccessKey} --secret_key={s3SecretKey} ls s3://{bucket_name}/{args.date}/  | awk '{{print $NF}}'").read().splitlines()):
+    # Vérifier si la date spécifiée existe sur S3 (HEAD sur l'archive, zstd puis gzip pour les sauvegardes antérieures)
+    restoreFolder = f"s3://{bucket_name}/{args.date}/"
+    if s3_exists(default_region, restoreFolder + "backup.tar.zst"):
+        if not shutil.which("zstd"):
+            progress("+! This restore point is compressed with zstd but zstd is not installed")
+            exit(1)
+        archiveName = "backup.tar.zst"
+        decompressProgram = " ".join(unzstdCommand)
+    elif s3_exists(default_region, restoreFolder + "backup.tar.gz"):
+        archiveName = "backup.tar.gz"
+        decompressProgram = gzipProgram + " -d"
+    else:
         progress("!- The date you specified does not exist on storage, please verify with --show command")
         exit()
+    # Dumps envoyés à part de l'archive (sauvegardes en flux), un objet par base
+    remoteDumps = {os.path.basename(uri).split(".")[0]: uri for uri in s3_ls(default_region, restoreFolder + "db/") if uri.endswith((".sql.zst", ".sql.gz"))}
+    # Archive compressée avec un dictionnaire zstd, stocké dans le même dossier
+    restoreDict = archiveName == "backup.tar.zst" and s3_exists(default_region, restoreFolder + zstdDictName)
+    if restoreDict:
+        decompressProgram += " -D " + os.path.join(workingDir, zstdDictName)
     
     if args.env == "dev" or args.env == "prod":
         progress(f"Starting restore from {args.date} folder in S3 backup ({bucket_name})")
         checkBaseFolder()
-        progress("-- Download backup to temp folder...")
-        run_command(f"s3cmd -q -c {scriptsDir}s3.cfg --host={default_region} --access_key={s3AccessKey} --secret_key={s3SecretKey} get s3://{bucket_name}/{args.date}/backup.tar.gz {os.path.join(workingDir, 'backup.tar.gz')}")
-        progress("done")
-        progress("-- Uncompress the backup to temp folder...")
-        run_command(f"tar -xzf {os.path.join(workingDir, 'backup.tar.gz')} -C {dumpDirPath}")
+        if restoreDict:
+            s3_get(default_region, f"s3://{bucket_name}/{args.date}/{zstdDictName}", os.path.join(workingDir, zstdDictName))
+        # Sauvegarde faite avec mydumper : un dossier unique pour toutes les bases
+        mydumperDir = os.path.join(dumpDirPath, 'mydumper')
+        # Bases stockées comme objets séparés : restaurées pendant le téléchargement et la restauration des fichiers
+        earlyDbs = [db for db in remoteDumps if db in dbList or not any(dbList)]
+        dbExecutor = ThreadPoolExecutor(max_workers=max(1, min(len(earlyDbs), remoteRestoreWorkers)))
+        if earlyDbs:
+            progress("Start database restoration : " + ", ".join(earlyDbs))
+        earlyRestores = dbExecutor.map(restore_db, earlyDbs)
+        # rm -rf / protection
+        restorePaths = [path for path in pathsList if len(path + "/*") > 2]
+        pathInfos = {}
+        if streamMode:
+            # Dossiers cibles vidés avant le téléchargement : les fichiers sont extraits directement en place
+            for path in restorePaths:
+                progress("-- Get target folder security settings for " + path + " and delete its content... ")
+                pathInfos[path] = os.stat(path)
+                clear_folder(path)
+                progress("done")
+            progress("-- Download and extract the backup in place...")
+            extractCmd = extract_in_place_command(decompressProgram)
+        else:
+            # Téléchargement et décompression simultanés, l'archive n'est jamais écrite sur disque
+            progress("-- Download and uncompress the backup to temp folder...")
+            extractCmd = ["tar", f"--use-compress-program={decompressProgram}", "-xf", "-", "-C", dumpDirPath]
+        extract = start_command(extractCmd, stdin=subprocess.PIPE)
+        s3_cat(default_region, f"s3://{bucket_name}/{args.date}/{archiveName}", extract.stdin)
+        extract.stdin.close()
+        wait_command(extract)
         progress("done")
         if any(pathsList):
             progress("Restore files")
-            for path in pathsList:
-                if len(path + "/*") > 2:  
+            for path in restorePaths:
+                if not streamMode:
                     progress("-- Get target folder security settings for " + path + " ... ")
-                    pathInfo = Path(path)
-                    owner = pathInfo.owner()
-                    group = pathInfo.group()
+                    pathInfos[path] = os.stat(path)
                     progress("done")
                     progress("-- Delete content in " + path + " ... ")
-                    # rm -rf / protection
-                    run_command(f'rm -rf {path}/*')
-                    progress("done")
-                    progress("-- Move restored file to " + path + " and restore security settings...")
-                    run_command(f'mv {os.path.join(dumpDirPath, path)}/* {path}')
-                    run_command(f'chown -R {owner}:{group} {path}')
+                    clear_folder(path)
                     progress("done")
+                progress("-- Move restored file to " + path + " and restore security settings...")
+                # Nothing to move when the archive was extracted in place
+                if os.path.isdir(dumpDirPath + path):
+                    move_folder_content(dumpDirPath + path, path)
+                chown_tree(path, pathInfos[path].st_uid, pathInfos[path].st_gid)
+                progress("done")
         else:
             progress("!- No files specified, database restoration only ")
-        if not any(dbList):
-            cleanDatabaseList = []
-            for dirpath, dirnames, filenames in os.walk(dumpDirPath):
-                for filename in filenames:
-                    if filename.endswith(".sql"):
-                        cleanDatabaseList.append(filename.split(".")[0])
-            dbList = cleanDatabaseList
+        # Progression des bases affichée ici pour ne pas s'intercaler avec celle des fichiers
+        for db in earlyRestores:
+            progress("-- Drop and restore database " + db + " from backup...")
+            progress("done")
+        dbExecutor.shutdown()
+        if os.path.isdir(mydumperDir) and not shutil.which("myloader"):
+            progress("+! This restore point was dumped with mydumper but myloader is not installed")
+            sys.exit(1)
+        if not any(dbList) and os.path.isdir(mydumperDir):
+            dbList = [filename.split("-schema-create.sql")[0] for filename in os.listdir(mydumperDir) if "-schema-create.sql" in filename]
+        elif not any(dbList):
+            # Les dumps sont à la racine du dossier temporaire, pas besoin de parcours récursif
+            dbList = [entry.name.split(".")[0] for entry in os.scandir(dumpDirPath) if entry.is_file() and entry.name.endswith((".sql", ".sql.zst"))]
+        # Bases restant à restaurer depuis le dossier temporaire (sauvegardes antérieures, mydumper, s3cmd)
+        dbList = [db for db in dbList if db and db not in earlyDbs]
         if any(dbList):
-            for db in dbList:
-                progress("Start database restoration : " + db)
-                progress("-- Drop " + db + " database before restoring data...")
-                run_command(f'mariadb-admin -s -u{dbadmin} -p{dbpassword} -h {dbhost} -f drop {db} > /dev/null')
-                progress("done")
-                progress("-- Restore database " + db + " from backup...")
-                run_command(f'mariadb-admin -s -u{dbadmin} -p{dbpassword} -h {dbhost} -f create {db}')
-                run_command(f'mariadb -u{dbadmin} -p{dbpassword} -h {dbhost} -D {db} < {os.path.join(dumpDirPath, f'{db}.sql')}')
-                progress("done")
-        else:
+            progress("Start database restoration : " + ", ".join(dbList))
+            # myloader utilise déjà tous les coeurs, une seule base à la fois dans ce cas
+            with ThreadPoolExecutor(max_workers=1 if os.path.isdir(mydumperDir) else min(len(dbList), os.cpu_count())) as executor:
+                for db in executor.map(restore_db, dbList):
+                    progress("-- Drop and restore database " + db + " from backup...")
+                    progress("done")
+        elif not earlyDbs:
             progress("!- Aucune base de donnée présente dans le fichier de restoration")
         if args.extra:
             progress("-- executing post-restore script")
-            run_command(f"{args.extra} > /dev/null")
+            run_command(shlex.split(args.extra), stdout=subprocess.DEVNULL)
+            progress("done")
+
+#####################
+#                   #
+#   Train dict      #
+#                   #
+#####################
+elif args.train_dict:
+    progress("Script executed in dictionary training mode at " + str(currentDate))
+    paths = [path for path in pathsList if path]
+    if not useZstd:
+        progress("+! zstd is not installed")
+        sys.exit(1)
+    if not paths:
+        progress("!- No files specified, nothing to train the dictionary on")
+        sys.exit(1)
+    if args.env == "dev" or args.env == "prod":
+        # Les fichiers sauvegardés servent d'échantillons : même contenu que les archives, sans téléchargement
+        progress("-- Train zstd dictionary from " + ", ".join(paths) + "...")
+        run_command(["zstd", "--train", "-q", "-f", "-r"] + paths + ["-o", zstdDictPath])
+        progress("done")
+        for priority, region in regionS3.items():
+            progress("-- Upload dictionary to " + region + " on s3://" + servicename + "-backup-" + priority + "/" + zstdDictFolder + "/...")
+            s3_put(region, zstdDictPath, f"s3://{servicename}-backup-{priority}/{zstdDictFolder}/")
             progress("done")
+    else:
+        progress("!- Please specify S3 environment prod or dev")
 
 #####################
 #                   #
@@ -302,14 +913,16 @@ elif args.show:
     if args.env == "dev" or args.env == "prod":
         # Définir la clé de région et le nom du bucket en fonction de l'environnement
         region_key = "primary" if args.env == "prod" else "primary-dev"
-        progress("List of available restoration points on : " + regionS3.get(region_key))
-        bucket = f"s3://{servicename}-backup-{region_key}/"
-        restorePoints = os.popen(f"s3cmd -c {scriptsDir}s3.cfg --host={regionS3.get(region_key)} --access_key={s3AccessKey} --secret_key={s3SecretKey} ls {bucket} | awk '{{print $NF}}'").read().splitlines()
-        for point in restorePoints:
-            parts = point.split('/')
-            if len(parts) > 3:
-                progress("-> " + parts[3])
-                print()
+        region = regionS3[region_key]
+        bucket = f"{servicename}-backup-{region_key}"
+        progress("List of available restoration points on : " + region)
+        cachePath = show_cache_path(region, bucket)
+        restorePoints = read_show_cache(cachePath)
+        if restorePoints is None:
+            restorePoints = [point for point in s3_list_folders(region, bucket) if point != zstdDictFolder]
+            write_show_cache(cachePath, restorePoints)
+        # Une seule écriture pour toute la liste
+        sys.stdout.write("".join(f"-> {point}\n" for point in restorePoints))
         exit()
     else:
         progress("!- Please specify S3 environment prod or dev")
@@ -319,7 +932,7 @@ elif args.show:
 # Skip cleanup if debug mode is enabled
 if not args.debug:
     progress("-- Local Cleanup...")
-    run_command(f"rm -rf {workingDir}")
+    run_command(["rm", "-rf", workingDir])
     progress("done")
 else:
     progress("-- Debug mode enabled, skipping cleanup")